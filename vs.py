@@ -5,10 +5,22 @@
 import tkinter as tk
 from tkinter import ttk, filedialog, messagebox
 from PIL import Image, ImageTk
-import cv2, sqlite3, os, qrcode, face_recognition, shutil
+import cv2, sqlite3, os, qrcode, face_recognition, shutil, threading
+import numpy as np
 from datetime import datetime
+import time
+from concurrent.futures import ThreadPoolExecutor
 import pandas as pd
 from pyzbar.pyzbar import decode  # for QR scanning
+try:
+    from numba import njit, prange  # optional: fused distance kernel for large galleries
+except ImportError:
+    njit = None
+try:
+    import xlsxwriter  # optional: much faster than openpyxl for plain xlsx writes
+    XLSX_ENGINE = "xlsxwriter"
+except ImportError:
+    XLSX_ENGINE = None  # pandas default (openpyxl)
 
 # ---------- CONFIG ----------
 LOGO_FILE = "logo.png"
@@ -20,10 +32,40 @@ TOLERANCE   = 0.4   # lower = stricter
 REQ_CONSEC  = 5     # consecutive matching frames to confirm
 CAM_WIDTH   = 480
 CAM_HEIGHT  = 360
+CAM_FPS     = 30
+FRAME_PERIOD = 1.0 / CAM_FPS  # preview tick in seconds
+QR_EVERY    = 3     # run the QR decoder on every Nth scanned frame
+
+# overlay drawing (RGB, drawn on the already converted preview buffer)
+FONT         = cv2.FONT_HERSHEY_SIMPLEX
+COL_READY    = (255, 255, 0)
+COL_LOOKING  = (0, 255, 255)
+COL_MATCH    = (0, 255, 0)
+COL_NO_MATCH = (255, 0, 0)
+ENCODE_SCALE = 0.5  # live frames are downscaled by this before face encoding
+ENCODE_MODEL = "small"  # 5-point landmarks, ~3x faster than "large"
 
 # ---------- DB ----------
-def get_conn(): 
-    return sqlite3.connect(DB_FILE)
+_conn = None
+
+def get_conn():
+    # one shared connection for the app; `with get_conn() as c:` is a BEGIN IMMEDIATE ... COMMIT
+    global _conn
+    if _conn is None:
+        _conn = sqlite3.connect(DB_FILE, check_same_thread=False, isolation_level="IMMEDIATE")
+        _conn.execute("PRAGMA journal_mode=WAL")
+        _conn.execute("PRAGMA synchronous=NORMAL")
+        _conn.execute("PRAGMA temp_store=MEMORY")
+        _conn.execute("PRAGMA mmap_size=268435456")
+    return _conn
+
+def close_conn():
+    # flush the WAL into the main file and drop the shared connection (backup/restore)
+    global _conn
+    if _conn is not None:
+        _conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        _conn.close()
+        _conn = None
 
 def init_db():
     os.makedirs("photos", exist_ok=True)
@@ -38,9 +80,14 @@ def init_db():
                 course TEXT,
                 mobile TEXT,
                 photo_path TEXT,
-                qr_path TEXT
+                qr_path TEXT,
+                encoding BLOB
             )
         """)
+        # older DBs were created without the encoding column
+        cols = [r[1] for r in c.execute("PRAGMA table_info(students)")]
+        if "encoding" not in cols:
+            c.execute("ALTER TABLE students ADD COLUMN encoding BLOB")
         c.execute("""
             CREATE TABLE IF NOT EXISTS attendance (
                 id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -52,9 +99,205 @@ def init_db():
             )
         """)
         c.execute("CREATE INDEX IF NOT EXISTS idx_attendance_student_date ON attendance(student_id, date)")
-        conn.commit()
+        # Reports filter on date alone and Tools groups by date; search scans reg_no/name
+        new_idx = not c.execute("SELECT 1 FROM sqlite_master WHERE type='index' "
+                                "AND name='idx_attendance_date'").fetchone()
+        c.execute("CREATE INDEX IF NOT EXISTS idx_attendance_date ON attendance(date)")
+        c.execute("CREATE INDEX IF NOT EXISTS idx_students_reg_no_name ON students(reg_no, name)")
+        if new_idx:
+            c.execute("ANALYZE")  # once, so the planner has stats for the new indexes
+
+def encode_face(rgb):
+    # 128-D face encoding as float32 bytes (None if no face found)
+    encs = face_recognition.face_encodings(rgb, model=ENCODE_MODEL)
+    if not encs:
+        return None
+    return encs[0].astype(np.float32).tobytes()
+
+CASC = cv2.CascadeClassifier(cv2.data.haarcascades + "haarcascade_frontalface_default.xml")
+
+def encode_live(rgb):
+    # live-frame encodings; runs on ENCODE_POOL (dlib releases the GIL) so Tk keeps drawing
+    small = cv2.resize(rgb, (0, 0), fx=ENCODE_SCALE, fy=ENCODE_SCALE,
+                       interpolation=cv2.INTER_AREA)
+    # cheap Haar pre-filter: empty frames never reach dlib
+    gray = cv2.cvtColor(small, cv2.COLOR_RGB2GRAY)
+    faces = CASC.detectMultiScale(gray, 1.2, 5, flags=cv2.CASCADE_SCALE_IMAGE)
+    if len(faces) == 0:
+        return []
+    # largest box, as dlib's (top, right, bottom, left) so its own detector is skipped
+    x, y, w, h = max(faces, key=lambda f: f[2] * f[3])
+    loc = (int(y), int(x + w), int(y + h), int(x))
+    return face_recognition.face_encodings(small, known_face_locations=[loc],
+                                           num_jitters=1, model=ENCODE_MODEL)
+
+ENCODE_POOL = ThreadPoolExecutor(max_workers=1)
+
+def warmup():
+    # push one dummy face box through the landmark + ResNet path so the first
+    # real frame in Auto Attendance doesn't pay the one-time model setup
+    blank = np.zeros((80, 80, 3), dtype=np.uint8)
+    face_recognition.face_encodings(blank, known_face_locations=[(0, 79, 79, 0)], model=ENCODE_MODEL)
+    if njit is not None:
+        # same for the Numba kernel: compile it here, not on the Tk thread at the first face
+        _sq_dists(np.zeros((2, 128), np.int8), np.zeros(128, np.int8), np.empty(2, np.int32))
+
+# One-shot migration for rows enrolled before the encoding column, in three steps so the
+# dlib part can run on ENCODE_POOL while the DB reads/writes stay on the Tk thread.
+# user_version records that it ran, so rows with no usable face aren't retried every launch.
+def backfill_rows():
+    # (id, photo_path) rows still to encode, or None once the migration has run
+    conn = get_conn()
+    if conn.execute("PRAGMA user_version").fetchone()[0] >= 1:
+        return None
+    return conn.execute("SELECT id, photo_path FROM students WHERE encoding IS NULL").fetchall()
+
+def encode_photos(rows):
+    # (blob, id) for every row whose stored photo has a usable face
+    updates = []
+    for sid, path in rows:
+        if not path or not os.path.exists(path):
+            continue
+        try:
+            blob = encode_face(face_recognition.load_image_file(path))
+        except Exception:
+            continue
+        if blob is not None:
+            updates.append((blob, sid))
+    return updates
+
+def apply_backfill(updates):
+    with get_conn() as c:
+        c.executemany("UPDATE students SET encoding=? WHERE id=?", updates)
+        c.execute("PRAGMA user_version=1")
+
+def query_rows(sql, params=()):
+    # (rows, column names) straight from the cursor; pandas only when exporting
+    cur = get_conn().execute(sql, params)
+    return cur.fetchall(), [d[0] for d in cur.description]
+
+def bulk_insert_students(rows):
+    # rows of (reg_no, name, course, mobile, photo_path, qr_path, encoding), one transaction
+    with get_conn() as c:
+        c.executemany("""INSERT INTO students (reg_no, name, course, mobile, photo_path, qr_path, encoding)
+                         VALUES (?, ?, ?, ?, ?, ?, ?)""", rows)
+
+# in-process copy of every enrolled encoding: reg_no -> (id, name, course, photo_path, encoding)
+ENC_CACHE = {}
+# the same encodings stacked as an (N, 128) matrix for 1-to-N identification;
+# updated in place so open windows see new enrollments
+GALLERY = {}
+
+def quantize(x, scale):
+    return np.clip(np.rint(x * scale), -127, 127).astype(np.int8)
+
+def rebuild_gallery():
+    recs = [(reg,) + rec for reg, rec in ENC_CACHE.items()]
+    if recs:
+        E = np.ascontiguousarray(np.vstack([r[5] for r in recs]))
+        # symmetric per-dimension int8 scale over the whole corpus
+        scale = (127.0 / np.maximum(np.abs(E).max(0), 1e-6)).astype(np.float32)
+    else:
+        E = np.empty((0, 128), dtype=np.float32)
+        scale = np.ones(128, dtype=np.float32)
+    GALLERY.update({"ids": [r[1] for r in recs],
+                    "info": [(r[0],) + r[2:5] for r in recs],   # reg_no, name, course, photo_path
+                    "E": E,
+                    "E_sq": (E * E).sum(1),
+                    # int8 copy, only scanned by the Numba kernel
+                    "E_q": quantize(E, scale) if njit is not None else None,
+                    "scale": scale})
+
+def cache_student(reg, sid, name, course, photo_path, encoding):
+    ENC_CACHE[reg] = (sid, name, course, photo_path, np.frombuffer(encoding, dtype=np.float32))
+    rebuild_gallery()
+
+def load_cache():
+    rows = get_conn().execute("""SELECT reg_no, id, name, course, photo_path, encoding
+                                 FROM students WHERE encoding IS NOT NULL""").fetchall()
+    ENC_CACHE.clear()
+    for reg, sid, name, course, photo_path, encoding in rows:
+        ENC_CACHE[reg] = (sid, name, course, photo_path, np.frombuffer(encoding, dtype=np.float32))
+    rebuild_gallery()
+
+if njit is not None:
+    @njit(parallel=True, fastmath=True, cache=True)
+    def _sq_dists(E, p, out):
+        # int8 rows: subtract, square and reduce in one pass per row
+        for i in prange(E.shape[0]):
+            s = 0
+            for j in range(E.shape[1]):
+                d = np.int32(E[i, j]) - np.int32(p[j])
+                s += d * d
+            out[i] = s
+
+RERANK_K = 8  # quantized candidates re-checked against the float encodings
+NUMBA_MIN_N = 1000  # below this, the kernel's parallel launch costs more than the scan
+
+def nearest(gallery, p):
+    # (index, L2 distance) of the enrolled encoding closest to probe p (float32)
+    E = gallery["E"]
+    if njit is not None and E.shape[0] >= NUMBA_MIN_N:
+        # coarse scan over the int8 matrix (4x less memory traffic than float32) ...
+        E_q = gallery["E_q"]
+        d2 = np.empty(E_q.shape[0], dtype=np.int32)
+        _sq_dists(E_q, quantize(p, gallery["scale"]), d2)
+        # ... then exact float distances for the best few, so TOLERANCE keeps its meaning
+        cand = np.argpartition(d2, RERANK_K - 1)[:RERANK_K]
+        diff = E[cand] - p
+        exact = np.einsum("ij,ij->i", diff, diff)
+        j = int(exact.argmin())
+        return int(cand[j]), float(np.sqrt(exact[j]))
+    # squared distances to all N encodings in one GEMV
+    d2 = gallery["E_sq"] + p @ p - 2 * (E @ p)
+    i = int(d2.argmin())
+    return i, float(np.sqrt(max(d2[i], 0.0)))
 
 init_db()
+_rows = backfill_rows()
+if _rows is not None:
+    apply_backfill(ENCODE_POOL.submit(encode_photos, _rows).result())
+load_cache()
+ENCODE_POOL.submit(warmup)  # same worker as live encoding, so the first frame queues behind it
+
+# ---------- Camera ----------
+class Camera:
+    # one shared VideoCapture for all windows; ref-counted so it is only freed on the last release
+    _inst = None
+
+    @classmethod
+    def instance(cls):
+        if cls._inst is None:
+            cls._inst = cls()
+        return cls._inst
+
+    def __init__(self):
+        self.cap = None
+        self.refs = 0
+
+    def get(self):
+        if self.cap is None or not self.cap.isOpened():
+            backend = cv2.CAP_DSHOW if os.name == "nt" else cv2.CAP_ANY
+            self.cap = cv2.VideoCapture(0, backend)
+            # compressed MJPG over USB and a 1-frame buffer so reads return the freshest frame;
+            # FOURCC has to be set before the size or some drivers ignore it
+            self.cap.set(cv2.CAP_PROP_FOURCC, cv2.VideoWriter_fourcc(*"MJPG"))
+            self.cap.set(cv2.CAP_PROP_BUFFERSIZE, 1)
+            self.cap.set(cv2.CAP_PROP_FPS, CAM_FPS)
+            self.cap.set(cv2.CAP_PROP_FRAME_WIDTH, CAM_WIDTH)
+            self.cap.set(cv2.CAP_PROP_FRAME_HEIGHT, CAM_HEIGHT)
+        return self.cap
+
+    def acquire(self):
+        self.refs += 1
+        return self.get()
+
+    def release(self):
+        self.refs = max(0, self.refs - 1)
+        if self.refs == 0 and self.cap is not None:
+            try: self.cap.release()
+            except: pass
+            self.cap = None
 
 # ---------- Small styled helpers ----------
 def neon_entry(parent, var=None, readonly=False, width=28):
@@ -76,6 +319,37 @@ def neon_button(parent, text, command, bg="#0aa", fg="white"):
     b.pack(pady=6, fill="x")
     return b
 
+def to_photo(rgb, width, height):
+    # PPM header + raw RGB bytes straight into Tk, much cheaper than PIL + ImageTk per frame
+    if rgb.shape[1] != width or rgb.shape[0] != height:
+        rgb = cv2.resize(rgb, (width, height))
+    hdr = b"P6\n%d %d\n255\n" % (width, height)
+    return tk.PhotoImage(data=hdr + rgb.tobytes())
+
+def on_pool(fn, args, done):
+    # run fn(*args) on ENCODE_POOL, the only thread that touches the dlib models, and
+    # hand done(result, error) back to the Tk thread; keep DB work in done()
+    def work():
+        try:
+            res, err = fn(*args), None
+        except Exception as e:
+            res, err = None, str(e)
+        root.after(0, lambda: done(res, err))
+    ENCODE_POOL.submit(work)
+
+def export_async(rows, cols, path):
+    # build + write the file on a background thread so the UI stays responsive;
+    # the result is reported back on the Tk thread
+    def work():
+        try:
+            df = pd.DataFrame(rows, columns=cols)
+            if path.lower().endswith(".csv"): df.to_csv(path, index=False)
+            else: df.to_excel(path, index=False, engine=XLSX_ENGINE)
+            root.after(0, lambda: messagebox.showinfo("Exported", f"Saved: {path}"))
+        except Exception as e:
+            root.after(0, lambda err=str(e): messagebox.showerror("Export Error", err))
+    threading.Thread(target=work, daemon=True).start()
+
 # ---------- Enrollment ----------
 def open_enrollment():
     win = tk.Toplevel(root)
@@ -101,16 +375,14 @@ def open_enrollment():
     lbl_video = tk.Label(video_frame, bg="#1e1e1e")
     lbl_video.pack()
 
-    cap = cv2.VideoCapture(0)
-    cap.set(cv2.CAP_PROP_FRAME_WIDTH, CAM_WIDTH)
-    cap.set(cv2.CAP_PROP_FRAME_HEIGHT, CAM_HEIGHT)
+    cap = Camera.instance().acquire()
 
     def update_cam():
+        if not win.winfo_exists(): return  # camera is shared, stop reading once closed
         ret, frame = cap.read()
         if ret:
             frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-            img = Image.fromarray(frame).resize((CAM_WIDTH//2, CAM_HEIGHT//2))
-            imgtk = ImageTk.PhotoImage(img)
+            imgtk = to_photo(frame, CAM_WIDTH//2, CAM_HEIGHT//2)
             lbl_video.imgtk = imgtk
             lbl_video.configure(image=imgtk)
         lbl_video.after(15, update_cam)
@@ -124,39 +396,45 @@ def open_enrollment():
         if not all([reg, name, course, mobile]):
             return messagebox.showerror("Error", "All fields required")
 
-        conn = get_conn()
-        cur = conn.cursor()
-        cur.execute("SELECT 1 FROM students WHERE reg_no=?", (reg,))
-        if cur.fetchone():
-            conn.close()
+        if get_conn().execute("SELECT 1 FROM students WHERE reg_no=?", (reg,)).fetchone():
             return messagebox.showerror("Error", "Student already registered")
 
         ok, frame = cap.read()
         if not ok:
-            conn.close()
             return messagebox.showerror("Error", "Camera error")
 
-        photo_path = os.path.join("photos", f"{reg}.jpg")
-        cv2.imwrite(photo_path, frame)
+        def done(encoding, err):
+            if btn_save.winfo_exists():
+                btn_save.config(state="normal")
+            if err:
+                return messagebox.showerror("Error", err)
+            if encoding is None:
+                return messagebox.showerror("Error", "No face detected, try again")
+            # checked again: the same reg may have been enrolled while encoding
+            if get_conn().execute("SELECT 1 FROM students WHERE reg_no=?", (reg,)).fetchone():
+                return messagebox.showerror("Error", "Student already registered")
+
+            photo_path = os.path.join("photos", f"{reg}.jpg")
+            cv2.imwrite(photo_path, frame)
+
+            qr_path = os.path.join("qrcodes", f"{reg}.png")
+            qrcode.make(reg).save(qr_path)
 
-        qr_path = os.path.join("qrcodes", f"{reg}.png")
-        qrcode.make(reg).save(qr_path)
+            bulk_insert_students([(reg, name, course, mobile, photo_path, qr_path, encoding)])
+            sid = get_conn().execute("SELECT id FROM students WHERE reg_no=?", (reg,)).fetchone()[0]
+            cache_student(reg, sid, name, course, photo_path, encoding)
 
-        cur.execute("""INSERT INTO students (reg_no, name, course, mobile, photo_path, qr_path)
-                       VALUES (?, ?, ?, ?, ?, ?)""",
-                    (reg, name, course, mobile, photo_path, qr_path))
-        conn.commit()
-        conn.close()
+            messagebox.showinfo("Success", f"{name} enrolled")
+            for e in vars_map.values():
+                if e.winfo_exists(): e.delete(0, tk.END)
 
-        messagebox.showinfo("Success", f"{name} enrolled")
-        for e in vars_map.values():
-            e.delete(0, tk.END)
+        btn_save.config(state="disabled")
+        on_pool(encode_face, (cv2.cvtColor(frame, cv2.COLOR_BGR2RGB),), done)
 
-    neon_button(form, "📷 Capture & Save", save_student, bg="#4CAF50")
+    btn_save = neon_button(form, "📷 Capture & Save", save_student, bg="#4CAF50")
 
     def on_close():
-        try: cap.release()
-        except: pass
+        Camera.instance().release()
         cv2.destroyAllWindows()
         win.destroy()
     win.protocol("WM_DELETE_WINDOW", on_close)
@@ -222,26 +500,35 @@ def open_attendance():
     status_lbl.pack(anchor="w")
 
     # camera
-    cam = cv2.VideoCapture(0)
-    cam.set(cv2.CAP_PROP_FRAME_WIDTH, CAM_WIDTH)
-    cam.set(cv2.CAP_PROP_FRAME_HEIGHT, CAM_HEIGHT)
+    cam = Camera.instance().acquire()
 
     # runtime state
     stored_encoding = [None]  # list to allow closure assignment
     running_match = [False]
     consecutive = [0]
+    candidate = [None]        # student id the consecutive count belongs to
+    marked = set()            # student ids saved in this session
+    gallery = GALLERY
+    inflight = [None]         # pending ENCODE_POOL future
+    overlay = [(COL_READY, None, None)]  # (color, msg, label) from the last result
+    rgb_buf = [np.empty((CAM_HEIGHT, CAM_WIDTH, 3), np.uint8)]  # reused every frame
+    next_tick = [time.monotonic()]  # when loop_frame should next run
 
     def fetch_student(regno):
-        # load details
-        conn = get_conn()
-        cur = conn.cursor()
-        cur.execute("SELECT id, name, course, photo_path FROM students WHERE reg_no=?", (regno,))
-        rec = cur.fetchone()
-        conn.close()
+        # load details; only students without an encoding miss the cache
+        rec = ENC_CACHE.get(regno)
+        if rec is None:
+            rec = get_conn().execute("SELECT id, name, course, photo_path, encoding FROM students WHERE reg_no=?",
+                                     (regno,)).fetchone()
+            if rec and rec[4] is not None:
+                rec = rec[:4] + (np.frombuffer(rec[4], dtype=np.float32),)
 
         if not rec:
             status_lbl.config(text="Student not found.")
             name_var.set(""); course_var.set(""); photo_var.set(""); sid_var.set("")
+            # drop any previous target so recognition falls back to 1-to-N
+            stored_encoding[0] = None
+            running_match[0] = False
             return
 
         sid_var.set(str(rec[0]))
@@ -249,33 +536,28 @@ def open_attendance():
         course_var.set(rec[2] or "")
         photo_var.set(rec[3] or "")
 
-        # get face encoding from stored photo
-        path = photo_var.get()
-        if not path or not os.path.exists(path):
-            status_lbl.config(text="Stored photo not found.")
-            return
-        try:
-            img = face_recognition.load_image_file(path)
-            encs = face_recognition.face_encodings(img)
-            if not encs:
-                status_lbl.config(text="No face in stored photo.")
-                return
-            stored_encoding[0] = encs[0]
-            status_lbl.config(text="Student loaded. Starting live recognition...")
-            start_recognition()
-        except Exception as e:
+        # face encoding precomputed at enrollment
+        if rec[4] is None:
             stored_encoding[0] = None
-            status_lbl.config(text=f"Error loading face: {e}")
+            status_lbl.config(text="No face encoding stored for student.")
+            return
+        stored_encoding[0] = rec[4]
+        status_lbl.config(text="Student loaded. Starting live recognition...")
+        start_recognition()
 
     def start_qr_scan():
         # Use the same camera; read frames and decode
         status_lbl.config(text="Scanning QR... (hold code in front of camera)")
+        scan_counter = [0]
         def scan_loop():
+            scan_counter[0] += 1
+            if scan_counter[0] % QR_EVERY:
+                return preview_label.after(30, scan_loop)
             ret, frame = cam.read()
             if ret:
-                # draw and show
-                rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-                codes = decode(rgb)
+                # pyzbar works on grayscale anyway
+                gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+                codes = decode(gray)
                 if codes:
                     # take first text
                     data = codes[0].data.decode("utf-8").strip()
@@ -289,70 +571,124 @@ def open_attendance():
     def start_recognition():
         if stored_encoding[0] is None or not sid_var.get():
             return
+        # loop_frame is already running and picks this up on its next result
         running_match[0] = True
         consecutive[0] = 0
-        loop_frame()
+        candidate[0] = None
+
+    def handle_result(encs):
+        # match/consec logic for one finished encode; returns (color, msg, label) overlay
+        verify = stored_encoding[0] is not None and running_match[0]
+        if not encs:
+            return COL_LOOKING, None, None
+        if verify:
+            diff = stored_encoding[0] - encs[0]
+            dist = float(np.sqrt(diff @ diff))
+            sid, info = int(sid_var.get()), None
+        elif gallery["ids"]:
+            i, dist = nearest(gallery, encs[0].astype(np.float32))
+            sid, info = gallery["ids"][i], gallery["info"][i]
+        else:
+            return COL_READY, None, None
+        pct = (1.0 - max(0.0, min(1.0, dist))) * 100.0
+        is_match = dist <= TOLERANCE
+        msg = f"Match: {pct:.2f}%"
+        color = COL_MATCH if is_match else COL_NO_MATCH
+        label = "MATCH" if is_match else "NO MATCH"
+        if is_match and info:
+            label = f"MATCH: {info[1]}"
+
+        if sid != candidate[0]:
+            candidate[0] = sid
+            consecutive[0] = 0
+        if is_match and not verify and sid in marked:
+            # already saved this session, don't keep re-inserting
+            status_lbl.config(text=f"Already marked: {info[1]}")
+        elif is_match:
+            consecutive[0] += 1
+        else:
+            consecutive[0] = max(0, consecutive[0]-1)
+
+        if consecutive[0] >= REQ_CONSEC:
+            # save attendance and stop matching for now
+            now = datetime.now()
+            with get_conn() as conn2:
+                conn2.execute("""INSERT OR IGNORE INTO attendance
+                                 (student_id, date, time, match_percentage)
+                                 VALUES (?, ?, ?, ?)""",
+                              (sid, now.strftime("%Y-%m-%d"),
+                               now.strftime("%H:%M:%S"), float(pct)))
+            marked.add(sid)
+            consecutive[0] = 0
+            if info:
+                reg_var.set(info[0]); sid_var.set(str(sid))
+                name_var.set(info[1] or ""); course_var.set(info[2] or ""); photo_var.set(info[3] or "")
+            running_match[0] = False
+            status_lbl.config(text=f"Attendance saved: {name_var.get()} ({pct:.2f}%)")
+            # reset enc so we can scan next student
+            stored_encoding[0] = None
+            # keep camera running, waiting for next reg or QR
+        return color, msg, label
 
     def loop_frame():
         # Unified preview loop for either waiting, QR, or recognition
-        ret, frame = cam.read()
+        if not win.winfo_exists(): return  # camera is shared, stop reading once closed
+        # fixed cadence: ticks are scheduled against a monotonic clock instead of
+        # "15 ms after this frame finished", so slow frames don't stretch the interval
+        now = time.monotonic()
+        behind = now > next_tick[0] + FRAME_PERIOD
+        if behind:
+            # more than a tick late: drop stale frames and resync instead of bursting
+            for _ in range(2): cam.grab()
+            ret, frame = cam.retrieve()
+            next_tick[0] = now
+        else:
+            ret, frame = cam.read()
+        next_tick[0] += FRAME_PERIOD
         if not ret:
             status_lbl.config(text="Camera not available.")
+            next_tick[0] = time.monotonic() + 0.15
             return preview_label.after(150, loop_frame)
 
-        display = frame.copy()
-        msg = "Ready"
-        color = (0, 255, 255)
-
-        if stored_encoding[0] is not None and running_match[0]:
-            # recognition mode
-            rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-            encs = face_recognition.face_encodings(rgb)
-            if encs:
-                dist = face_recognition.face_distance([stored_encoding[0]], encs[0])[0]
-                pct = (1.0 - max(0.0, min(1.0, float(dist)))) * 100.0
-                is_match = dist <= TOLERANCE
-                msg = f"Match: {pct:.2f}%"
-                color = (0, 255, 0) if is_match else (0, 0, 255)
-                cv2.putText(display, msg, (16, 36), cv2.FONT_HERSHEY_SIMPLEX, 1, color, 2)
-                cv2.putText(display, "MATCH" if is_match else "NO MATCH", (16, 72),
-                            cv2.FONT_HERSHEY_SIMPLEX, 0.9, color, 2)
-                if is_match:
-                    consecutive[0] += 1
-                else:
-                    consecutive[0] = max(0, consecutive[0]-1)
-
-                if consecutive[0] >= REQ_CONSEC:
-                    # save attendance and stop matching for now
-                    now = datetime.now()
-                    with get_conn() as conn2:
-                        cur2 = conn2.cursor()
-                        cur2.execute("""INSERT OR IGNORE INTO attendance
-                                        (student_id, date, time, match_percentage)
-                                        VALUES (?, ?, ?, ?)""",
-                                     (sid_var.get(), now.strftime("%Y-%m-%d"),
-                                      now.strftime("%H:%M:%S"), float(pct)))
-                        conn2.commit()
-                    running_match[0] = False
-                    status_lbl.config(text=f"Attendance saved: {name_var.get()} ({pct:.2f}%)")
-                    # reset enc so we can scan next student
-                    stored_encoding[0] = None
-                    # keep camera running, waiting for next reg or QR
-            else:
-                msg = "Looking for face..."
-                color = (255, 255, 0)
+        # one BGR->RGB conversion per frame, into a reused buffer; it feeds both
+        # the encoder and the preview (the overlay is drawn on it afterwards)
+        if rgb_buf[0].shape != frame.shape:
+            rgb_buf[0] = np.empty_like(frame)  # camera ignored the requested size
+        rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB, dst=rgb_buf[0])
+
+        # verify mode: a fetched student is matched 1-to-1;
+        # otherwise every enrolled student is searched (1-to-N)
+        verify = stored_encoding[0] is not None and running_match[0]
+        if verify or gallery["ids"]:
+            # encoding runs on ENCODE_POOL; only hand it a new frame once the last one is done
+            fut = inflight[0]
+            if fut is not None and fut.done():
+                inflight[0] = None
+                try:
+                    overlay[0] = handle_result(fut.result())
+                except Exception as e:
+                    status_lbl.config(text=f"Recognition error: {e}")
+            if inflight[0] is None and not behind:
+                # the worker keeps its own copy, rgb is drawn on and reused below
+                inflight[0] = ENCODE_POOL.submit(encode_live, rgb.copy())
+        else:
+            overlay[0] = (COL_READY, None, None)
+
+        color, msg, label = overlay[0]
+        if msg:
+            cv2.putText(rgb, msg, (16, 36), FONT, 1, color, 2)
+            cv2.putText(rgb, label, (16, 72), FONT, 0.9, color, 2)
 
         # draw instruction
-        cv2.rectangle(display, (10, 10), (CAM_WIDTH-10, CAM_HEIGHT-10), color, 2)
+        cv2.rectangle(rgb, (10, 10), (CAM_WIDTH-10, CAM_HEIGHT-10), color, 2)
 
         # update tkinter image
-        rgb_disp = cv2.cvtColor(display, cv2.COLOR_BGR2RGB)
-        img = Image.fromarray(rgb_disp).resize((CAM_WIDTH, CAM_HEIGHT))
-        imgtk = ImageTk.PhotoImage(img)
+        imgtk = to_photo(rgb, CAM_WIDTH, CAM_HEIGHT)
         preview_label.imgtk = imgtk
         preview_label.configure(image=imgtk)
 
-        preview_label.after(15, loop_frame)
+        delay = max(1, int((next_tick[0] - time.monotonic()) * 1000))
+        preview_label.after(delay, loop_frame)
 
     # Enter on reg field triggers fetch + auto recognition
     def on_enter_reg(event=None):
@@ -365,8 +701,7 @@ def open_attendance():
     loop_frame()
 
     def on_close():
-        try: cam.release()
-        except: pass
+        Camera.instance().release()
         cv2.destroyAllWindows()
         win.destroy()
     win.protocol("WM_DELETE_WINDOW", on_close)
@@ -381,9 +716,7 @@ def open_reports():
     date_var = tk.StringVar()
     search_var = tk.StringVar()
 
-    def load_dataframe(date_filter=None, search_filter=None):
-        if not os.path.exists(DB_FILE): return pd.DataFrame()
-        conn = get_conn()
+    def load_rows(date_filter=None, search_filter=None):
         base = """
             SELECT s.reg_no AS "Reg No",
                    s.name   AS "Name",
@@ -402,36 +735,27 @@ def open_reports():
             q = f"%{search_filter}%"; params.extend([q, q])
         if conds: base += " WHERE " + " AND ".join(conds)
         base += " ORDER BY a.date DESC, a.time DESC"
-        df = pd.read_sql_query(base, conn, params=params); conn.close()
-        return df
+        return query_rows(base, params)
 
     def update_table():
         for r in tree.get_children(): tree.delete(r)
-        df = load_dataframe(date_var.get().strip() or None, search_var.get().strip() or None)
-        for _, row in df.iterrows():
-            tree.insert("", tk.END, values=(row["Reg No"], row["Name"], row["Course"],
-                                            row["Date"], row["Time"],
-                                            f"{float(row['Match %']):.2f}%"))
+        rows, _ = load_rows(date_var.get().strip() or None, search_var.get().strip() or None)
+        for reg, name, course, date, tm, pct in rows:
+            tree.insert("", tk.END, values=(reg, name, course, date, tm, f"{float(pct or 0):.2f}%"))
 
     def export_data():
-        df = load_dataframe(date_var.get().strip() or None, search_var.get().strip() or None)
-        if df.empty:
+        rows, cols = load_rows(date_var.get().strip() or None, search_var.get().strip() or None)
+        if not rows:
             return messagebox.showwarning("No Data", "Nothing to export.")
         path = filedialog.asksaveasfilename(defaultextension=".xlsx",
                                             filetypes=[("Excel", "*.xlsx"), ("CSV", "*.csv")])
         if not path: return
-        try:
-            if path.lower().endswith(".csv"): df.to_csv(path, index=False)
-            else: df.to_excel(path, index=False)
-            messagebox.showinfo("Exported", f"Saved: {path}")
-        except Exception as e:
-            messagebox.showerror("Export Error", str(e))
+        export_async(rows, cols, path)
 
     def refresh_dates_dropdown():
         conn = get_conn(); cur = conn.cursor()
         cur.execute("SELECT DISTINCT date FROM attendance ORDER BY date DESC LIMIT 100")
         rows = [r[0] for r in cur.fetchall()]
-        conn.close()
         date_combo["values"] = [""] + rows
 
     # Top controls
@@ -504,33 +828,126 @@ def open_tools_window():
         if not os.path.exists(DB_FILE): return messagebox.showerror("Error","DB not found")
         dest = filedialog.asksaveasfilename(defaultextension=".db", filetypes=[("SQLite DB","*.db")])
         if not dest: return
+        close_conn()  # checkpoint so the copy has everything still in the WAL
         shutil.copy2(DB_FILE, dest)
         messagebox.showinfo("Backup", f"Saved to: {dest}")
     def restore_db():
         src = filedialog.askopenfilename(filetypes=[("SQLite DB","*.db"),("All files","*.*")])
         if not src: return
         if not messagebox.askyesno("Confirm","Overwrite current DB?"): return
+        close_conn()
+        for ext in ("-wal", "-shm"):
+            if os.path.exists(DB_FILE + ext): os.remove(DB_FILE + ext)
         shutil.copy2(src, DB_FILE)
-        messagebox.showinfo("Restore","Database restored.")
+        init_db()
+        load_cache()  # drop the old DB's students right away
+        rows = backfill_rows()  # the restored DB may predate the encoding column
+        if rows is None:
+            return messagebox.showinfo("Restore","Database restored.")
+
+        def done(updates, err):
+            if btn_restore.winfo_exists():
+                btn_restore.config(state="normal")
+            if err:
+                return messagebox.showerror("Restore", err)
+            apply_backfill(updates)
+            load_cache()
+            messagebox.showinfo("Restore","Database restored.")
+        btn_restore.config(state="disabled")
+        on_pool(encode_photos, (rows,), done)
     tk.Button(frm_db, text="Backup", command=backup_db, bg="#2196F3", fg="white").pack(side="left", padx=8)
-    tk.Button(frm_db, text="Restore", command=restore_db, bg="#f39c12", fg="white").pack(side="left", padx=8)
-
-    # Export students
-    frm_students = tk.LabelFrame(win, text="Export Student List", bg="#161616", fg="white", padx=10, pady=10)
+    btn_restore = tk.Button(frm_db, text="Restore", command=restore_db, bg="#f39c12", fg="white")
+    btn_restore.pack(side="left", padx=8)
+    def reload_cache():
+        load_cache()
+        messagebox.showinfo("Cache", f"Loaded {len(ENC_CACHE)} face encoding(s).")
+    tk.Button(frm_db, text="Reload Cache", command=reload_cache, bg="#777", fg="white").pack(side="left", padx=8)
+
+    # Import / export students
+    frm_students = tk.LabelFrame(win, text="Import / Export Student List", bg="#161616", fg="white", padx=10, pady=10)
     frm_students.pack(fill="x", padx=12, pady=6)
     def export_students():
-        conn = get_conn()
-        df = pd.read_sql_query("""SELECT reg_no AS "Reg No", name AS "Name",
-                                         course AS "Course", mobile AS "Mobile"
-                                  FROM students ORDER BY reg_no""", conn)
-        conn.close()
-        if df.empty: return messagebox.showinfo("No Data","No students.")
+        rows, cols = query_rows("""SELECT reg_no AS "Reg No", name AS "Name",
+                                       course AS "Course", mobile AS "Mobile"
+                                FROM students ORDER BY reg_no""")
+        if not rows: return messagebox.showinfo("No Data","No students.")
         path = filedialog.asksaveasfilename(defaultextension=".xlsx",
                                             filetypes=[("Excel","*.xlsx"),("CSV","*.csv")])
         if not path: return
-        if path.lower().endswith(".csv"): df.to_csv(path, index=False)
-        else: df.to_excel(path, index=False)
-        messagebox.showinfo("Exported", f"Saved: {path}")
+        export_async(rows, cols, path)
+    def import_csv():
+        # CSV columns: Reg No, Name, Course, Mobile, Photo (path to a face image)
+        src = filedialog.askopenfilename(filetypes=[("CSV","*.csv"),("All files","*.*")])
+        if not src: return
+        try:
+            df = pd.read_csv(src, dtype=str).fillna("")
+            df = df[["Reg No","Name","Course","Mobile","Photo"]]
+        except Exception as e:
+            return messagebox.showerror("Import Error", str(e))
+        existing = {r[0] for r in get_conn().execute("SELECT reg_no FROM students")}
+        todo = []
+        for reg, name, course, mobile, photo in df.itertuples(index=False):
+            reg = reg.strip()
+            if reg and reg not in existing and os.path.exists(photo):
+                existing.add(reg)
+                todo.append((reg, name.strip(), course.strip(), mobile.strip(), photo))
+
+        def prepare(row):
+            # load + encode one photo; the photo copy and QR are written under temporary
+            # names and only moved to photos/{reg}.jpg, qrcodes/{reg}.png once inserted
+            reg, name, course, mobile, photo = row
+            try:
+                img = face_recognition.load_image_file(photo)
+                encoding = encode_face(img)
+            except Exception:
+                return None
+            if encoding is None:
+                return None
+            photo_path = os.path.join("photos", f"{reg}.jpg")
+            qr_path = os.path.join("qrcodes", f"{reg}.png")
+            tmp_photo = os.path.join("photos", f".import-{reg}.jpg")
+            tmp_qr = os.path.join("qrcodes", f".import-{reg}.png")
+            cv2.imwrite(tmp_photo, cv2.cvtColor(img, cv2.COLOR_RGB2BGR))
+            qrcode.make(reg).save(tmp_qr)
+            return (reg, name, course, mobile, photo_path, qr_path, encoding), (tmp_photo, tmp_qr)
+
+        def work():
+            # serially on ENCODE_POOL: the dlib models are module-global, so this is the one
+            # thread that uses them; the DB insert happens in done() on the Tk thread
+            return [r for r in map(prepare, todo) if r is not None]
+
+        def done(rows, err):
+            if btn_import.winfo_exists():
+                btn_import.config(state="normal", text="Import CSV")
+            if err:
+                return messagebox.showerror("Import Error", err)
+            # checked again: students may have been enrolled while the photos were encoded
+            taken = {r[0] for r in get_conn().execute("SELECT reg_no FROM students")}
+            keep = [row for row, _ in rows if row[0] not in taken]
+            try:
+                if keep:
+                    bulk_insert_students(keep)
+            except sqlite3.Error as e:
+                keep, error = [], str(e)
+            else:
+                error = None
+            # move files into place only for inserted rows, never over an enrolled student's
+            kept = {row[0] for row in keep}
+            for row, tmps in rows:
+                for tmp, final in zip(tmps, row[4:6]):
+                    if row[0] in kept: os.replace(tmp, final)
+                    else: os.remove(tmp)
+            if error:
+                return messagebox.showerror("Import Error", error)
+            if keep:
+                load_cache()
+            messagebox.showinfo("Import", f"Imported {len(keep)} student(s), skipped {len(df) - len(keep)}.")
+
+        btn_import.config(state="disabled", text="Importing...")
+        on_pool(work, (), done)
+    btn_import = tk.Button(frm_students, text="Import CSV", command=import_csv,
+                           bg="#16a085", fg="white")
+    btn_import.pack(side="left", padx=8)
     tk.Button(frm_students, text="Export Students", command=export_students,
               bg="#8e44ad", fg="white").pack(side="left", padx=8)
 
@@ -547,26 +964,20 @@ def open_tools_window():
     tree_sum.configure(yscrollcommand=vsb2.set)
     vsb2.pack(side="left", fill="y", padx=6)
 
+    summary_sql = """SELECT date AS "Date", COUNT(*) AS "Present Count"
+                     FROM attendance GROUP BY date ORDER BY date DESC"""
     def load_summary():
         for r in tree_sum.get_children(): tree_sum.delete(r)
-        conn = get_conn()
-        df = pd.read_sql_query("""SELECT date AS "Date", COUNT(*) AS "Present Count"
-                                  FROM attendance GROUP BY date ORDER BY date DESC""", conn)
-        conn.close()
-        for _, row in df.iterrows():
-            tree_sum.insert("", tk.END, values=(row["Date"], int(row["Present Count"])))
+        rows, _ = query_rows(summary_sql)
+        for v in rows:
+            tree_sum.insert("", tk.END, values=v)
     def export_summary():
-        conn = get_conn()
-        df = pd.read_sql_query("""SELECT date AS "Date", COUNT(*) AS "Present Count"
-                                  FROM attendance GROUP BY date ORDER BY date DESC""", conn)
-        conn.close()
-        if df.empty: return messagebox.showinfo("No Data","Nothing to export.")
+        rows, cols = query_rows(summary_sql)
+        if not rows: return messagebox.showinfo("No Data","Nothing to export.")
         path = filedialog.asksaveasfilename(defaultextension=".xlsx",
                                             filetypes=[("Excel","*.xlsx"),("CSV","*.csv")])
         if not path: return
-        if path.lower().endswith(".csv"): df.to_csv(path, index=False)
-        else: df.to_excel(path, index=False)
-        messagebox.showinfo("Exported", f"Saved: {path}")
+        export_async(rows, cols, path)
 
     btns = tk.Frame(frm_sum, bg="#161616")
     btns.pack(side="left", fill="y", padx=10)
@@ -634,6 +1045,9 @@ def exit_app():
 tk.Label(bottom, text=DEVELOPER_TEXT, fg="#B0B0B0", bg="#121212", font=("Segoe UI", 11)).pack(side="left", padx=20)
 tk.Button(bottom, text="Exit", command=exit_app, bg="#d32f2f", fg="white").pack(side="right", padx=18)
 
+# open the camera once, after the dashboard has painted; held until the app exits
+root.after(100, Camera.instance().acquire)
+
 # shortcuts
 root.bind("<Escape>", lambda e: exit_app())
 root.bind("e", lambda e: open_enrollment())
@@ -642,3 +1056,4 @@ root.bind("r", lambda e: open_reports())
 root.bind("t", lambda e: open_tools_window())
 
 root.mainloop()
+Camera.instance().release()